@@ -12,31 +12,40 @@ Example:
 Requirements:
     - Google Drive folder must be publicly shared (Anyone with the link → Viewer)
     - GENAI_API_KEY must be set in .env or environment variable
-    - Dependencies: gdown, google-generativeai, openpyxl, python-dotenv
+    - Dependencies: gdown, google-generativeai, openpyxl, xlsxwriter, python-dotenv
 """
 
 import os
 import re
 import sys
-import json
+import atexit
 import time
+import random
 import shutil
 import argparse
+import threading
+import sqlite3
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Any, Union, List
-from datetime import datetime
+from typing import Dict, Any, Union, List, Optional, Iterable, Iterator
+from datetime import date, datetime, time as dt_time, timedelta
 
 # Load environment variables from .env
 from dotenv import load_dotenv
 load_dotenv()
 
 import gdown
+import requests
+import orjson
 import google.generativeai as genai
-from openpyxl import Workbook
-import pandas as pd
+from google.api_core import exceptions as google_exceptions
+import openpyxl
+import xlsxwriter
 
 import io
+import itertools
+import mmap
 import pickle
 from pathlib import Path
 from datetime import datetime
@@ -51,7 +60,43 @@ SCRIPT_DIR = Path(__file__).parent.resolve()
 REMOTE_PDFS_DIR = SCRIPT_DIR / 'remote_pdfs'
 JSON_OUTPUTS_DIR = SCRIPT_DIR / 'json_outputs'
 SAMPLE_PDF = SCRIPT_DIR / 'sample.pdf'
-PROCESSED_FILES_DB = Path("processed_files.json")
+RESPONSE_CACHE_DIR = SCRIPT_DIR / 'response_cache'
+# SQLite database of processed files (WAL mode, safe to share between runs)
+PROCESSED_FILES_DB = Path("processed.db")
+# Ledgers written by earlier releases, imported when PROCESSED_FILES_DB is created
+JSONL_PROCESSED_FILES_DB = Path("processed_files.jsonl")
+LEGACY_PROCESSED_FILES_DB = Path("processed_files.json")
+# Content hash used as the processed-files key (records without it are legacy MD5)
+FILE_HASH_ALGO = 'blake2b'
+# Files at least this large are hashed through mmap instead of a single read()
+MMAP_HASH_MIN_BYTES = 1024 * 1024
+GEMINI_MODEL = 'gemini-flash-latest'
+_FOLDER_RE = re.compile(r'folders/([A-Za-z0-9_-]+)')
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_DOWNLOAD_WORKERS = 10
+# Drive v3 listing used to skip already processed files before downloading them
+DRIVE_FILES_URL = 'https://www.googleapis.com/drive/v3/files'
+# Gemini's limit for a whole inline request, prompt included
+INLINE_REQUEST_MAX_BYTES = 20_000_000
+# Upload status poll cap (seconds) when several PDFs are in flight at once
+CONCURRENT_POLL_INTERVAL = 0.5
+# Threads reading and parsing JSON files while aggregating a directory
+JSON_READ_WORKERS = 16
+
+# Client-side Gemini quotas (0 disables the corresponding limit)
+DEFAULT_RPM = 15
+DEFAULT_TPM = 1_000_000
+# Token cost reserved per generate call; corrected from usage metadata afterwards
+ESTIMATED_TOKENS_PER_REQUEST = 2000
+MAX_RATE_LIMIT_RETRIES = 5
+
+# Gemini context cache holding PROMPT, refreshed before the TTL runs out
+PROMPT_CACHE_TTL = timedelta(hours=1)
+PROMPT_CACHE_REFRESH_SECONDS = 50 * 60
+# Explicit caching needs a versioned model (not a '-latest' alias) and at least this many tokens
+PROMPT_CACHE_MIN_TOKENS = 1024
+# Rough prompt size estimate, good enough to tell whether caching is worth a request
+CHARS_PER_TOKEN = 4
 
 
 PROMPT = """
@@ -117,6 +162,13 @@ IMPORTANT EXTRACTION RULES:
 4. Return ONLY valid JSON without any additional text or explanation
 """
 
+# PDFs below this size are sent inline with the request instead of via the File API;
+# inline data is base64-encoded, so it grows by 4/3 on the wire
+INLINE_PDF_MAX_BYTES = (INLINE_REQUEST_MAX_BYTES - len(PROMPT.encode('utf-8'))) * 3 // 4
+
+# Cached responses are only valid for the prompt and model that produced them
+PROMPT_HASH = hashlib.sha256(f'{GEMINI_MODEL}\n{PROMPT}'.encode('utf-8')).hexdigest()
+
 EXCEL_COLUMNS = [
     'Date',
     'Source PDF',
@@ -144,57 +196,330 @@ EXCEL_COLUMNS = [
     'Head of expense'
 ]
 
+# ============================================================================
+# Rate Limiting
+# ============================================================================
+
+class RateLimiter:
+    """
+    Thread-safe token bucket that refills `per_minute` tokens every minute.
+    
+    acquire() blocks the calling thread until enough tokens are available.
+    A non-positive rate disables limiting.
+    """
+    
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def acquire(self, cost: float = 1):
+        """Block until `cost` tokens are available, then take them."""
+        if self.rate <= 0:
+            return
+        # A single request larger than the bucket would otherwise wait forever
+        cost = min(cost, self.capacity)
+        with self.cond:
+            self._refill()
+            while self.tokens < cost:
+                self.cond.wait((cost - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= cost
+    
+    def adjust(self, delta: float):
+        """Take (positive) or return (negative) tokens without blocking."""
+        if self.rate <= 0 or not delta:
+            return
+        with self.cond:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+            self.cond.notify_all()
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """Check whether an API exception is a 429 / quota exhausted error."""
+    return isinstance(e, google_exceptions.ResourceExhausted) or getattr(e, 'code', None) == 429
+
+
+def call_with_backoff(fn, *args, before_attempt=None, max_retries=MAX_RATE_LIMIT_RETRIES, **kwargs):
+    """
+    Call `fn`, retrying 429 errors with capped exponential backoff and jitter.
+    
+    Args:
+        fn: Callable to invoke with *args and **kwargs
+        before_attempt: Optional callable run before every attempt (e.g. to acquire rate limiter tokens)
+        max_retries: Number of retries after the first attempt
+    """
+    for attempt in range(max_retries + 1):
+        if before_attempt:
+            before_attempt()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == max_retries or not is_rate_limit_error(e):
+                raise
+            delay = min(60, 2 ** attempt) + random.uniform(0, 1)
+            print(f'  Rate limited, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})...')
+            time.sleep(delay)
+
+
 # ============================================================================
 # Helper Functions
 # ============================================================================
 #-------------------------------------------------------
 
-def get_file_hash(filepath: Path) -> str:
-    """Generate unique hash for file content."""
-    hash_md5 = hashlib.md5()
+def _hash_file(filepath: Path, *hash_fns) -> tuple:
+    """
+    Apply each of `hash_fns` to the content of a file read only once.
+    
+    Large files are memory-mapped so each hash runs over the whole file
+    in one C call.
+    """
     with open(filepath, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+        if os.fstat(f.fileno()).st_size < MMAP_HASH_MIN_BYTES:
+            data = f.read()
+            return tuple(fn(data) for fn in hash_fns)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return tuple(fn(mm) for fn in hash_fns)
 
 
-def load_processed_files() -> Dict[str, dict]:
-    """Load the database of processed files."""
-    if not PROCESSED_FILES_DB.exists():
-        return {}
+def get_file_hash(filepath: Path) -> str:
+    """
+    Generate unique hash for file content.
     
+    Uses 128-bit BLAKE2b, which is only a dedup key and need not be
+    cryptographic.
+    """
+    return _hash_file(filepath, get_bytes_hash)[0]
+
+
+def get_file_hashes(filepath: Path) -> tuple:
+    """Return (get_file_hash, get_legacy_file_hash) of a file in one read."""
+    return _hash_file(filepath, get_bytes_hash, get_bytes_md5)
+
+
+def get_bytes_hash(data) -> str:
+    """Hash file content that is already in memory; matches get_file_hash."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def get_bytes_md5(data) -> str:
+    """MD5 of file content that is already in memory; matches get_legacy_file_hash."""
+    return hashlib.md5(data).hexdigest()
+
+
+def get_legacy_file_hash(filepath: Path) -> str:
+    """
+    MD5 content hash, used as the processed-files key before BLAKE2b.
+    
+    It is also what Google Drive reports as md5Checksum, so it is kept in
+    processed records to recognise files before downloading them.
+    """
+    return _hash_file(filepath, get_bytes_md5)[0]
+
+
+# Connection to PROCESSED_FILES_DB, opened on first use and shared by all
+# threads; extraction workers record results concurrently, so every access
+# holds _PROCESSED_LOCK.
+_PROCESSED_CONN: Optional[sqlite3.Connection] = None
+_PROCESSED_LOCK = threading.Lock()
+# Columns besides the hash key; size and mtime_ns let unchanged files skip hashing
+_PROCESSED_SCHEMA = (
+    ('filename', 'TEXT'), ('processed_date', 'TEXT'), ('file_path', 'TEXT'),
+    ('hash_algo', 'TEXT'), ('size', 'INTEGER'), ('mtime_ns', 'INTEGER'),
+    ('content_md5', 'TEXT'),
+)
+_PROCESSED_COLUMNS = tuple(name for name, _ in _PROCESSED_SCHEMA)
+# Hashes bound per IN (...) query; SQLite's default limit is 999 parameters
+_PROCESSED_QUERY_BATCH = 500
+
+
+def _apply_record(processed: Dict[str, dict], record: dict):
+    """Fold one JSONL log record into `processed` (tombstones delete)."""
+    record = dict(record)
+    file_hash = record.pop('h')
+    if record.get('deleted'):
+        processed.pop(file_hash, None)
+    else:
+        processed[file_hash] = record
+
+
+def _read_legacy_ledger() -> Dict[str, dict]:
+    """Read the JSONL log or JSON file written by earlier releases, if any."""
+    processed = {}
     try:
-        with open(PROCESSED_FILES_DB, 'r') as f:
-            return json.load(f)
+        if JSONL_PROCESSED_FILES_DB.exists():
+            with open(JSONL_PROCESSED_FILES_DB, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        _apply_record(processed, orjson.loads(line))
+        elif LEGACY_PROCESSED_FILES_DB.exists():
+            with open(LEGACY_PROCESSED_FILES_DB, 'rb') as f:
+                processed = orjson.loads(f.read())
     except Exception as e:
-        print(f"Warning: Could not load processed files database: {e}")
-        return {}
+        print(f"Warning: Could not import legacy processed files database: {e}")
+    return processed
+
+
+def _write_records(conn: sqlite3.Connection, processed: Dict[str, dict], replace: bool = False):
+    """
+    Insert or replace `processed` entries in one transaction.
+    
+    With `replace`, all existing entries are deleted in the same transaction,
+    so a failed write leaves the table as it was.
+    """
+    # The connection is in autocommit mode, so the transaction must be opened explicitly
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        if replace:
+            conn.execute('DELETE FROM processed')
+        conn.executemany(
+            f'INSERT OR REPLACE INTO processed (hash, {", ".join(_PROCESSED_COLUMNS)}) '
+            f'VALUES ({", ".join("?" * (len(_PROCESSED_COLUMNS) + 1))})',
+            [(h, *(info.get(c) for c in _PROCESSED_COLUMNS)) for h, info in processed.items()]
+        )
+
+
+def _get_processed_db() -> sqlite3.Connection:
+    """
+    Open PROCESSED_FILES_DB, creating it on first use.
+    
+    A new database imports the ledger of an earlier release so already
+    processed files are not sent to Gemini again. Callers hold _PROCESSED_LOCK.
+    """
+    global _PROCESSED_CONN
+    if _PROCESSED_CONN is None:
+        is_new = not PROCESSED_FILES_DB.exists()
+        conn = sqlite3.connect(str(PROCESSED_FILES_DB), isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS processed (hash TEXT PRIMARY KEY, '
+            + ', '.join(f'{name} {sql_type}' for name, sql_type in _PROCESSED_SCHEMA) + ')'
+        )
+        # Databases created before a column was added get it as NULL
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(processed)')}
+        for name, sql_type in _PROCESSED_SCHEMA:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE processed ADD COLUMN {name} {sql_type}')
+        conn.execute('CREATE INDEX IF NOT EXISTS processed_file_path ON processed (file_path)')
+        conn.execute('CREATE INDEX IF NOT EXISTS processed_content_md5 ON processed (content_md5)')
+        if is_new:
+            _write_records(conn, _read_legacy_ledger())
+        _PROCESSED_CONN = conn
+    return _PROCESSED_CONN
+
+
+def close_processed_db():
+    """Close the database connection, checkpointing the WAL."""
+    global _PROCESSED_CONN
+    with _PROCESSED_LOCK:
+        if _PROCESSED_CONN is not None:
+            _PROCESSED_CONN.close()
+            _PROCESSED_CONN = None
+
+
+atexit.register(close_processed_db)
+
+
+def _row_to_info(row) -> dict:
+    """Map a row of _PROCESSED_COLUMNS values to an info dict."""
+    return dict(zip(_PROCESSED_COLUMNS, row))
+
+
+def load_processed_files() -> Dict[str, dict]:
+    """Load the database of processed files as {hash: info}."""
+    with _PROCESSED_LOCK:
+        rows = _get_processed_db().execute(
+            f'SELECT hash, {", ".join(_PROCESSED_COLUMNS)} FROM processed'
+        ).fetchall()
+    return {row[0]: _row_to_info(row[1:]) for row in rows}
+
+
+def _query_processed(column: str, values: List[str]) -> List[tuple]:
+    """Fetch (hash, info) for records whose `column` is one of `values`, oldest first."""
+    found = []
+    with _PROCESSED_LOCK:
+        conn = _get_processed_db()
+        for start in range(0, len(values), _PROCESSED_QUERY_BATCH):
+            batch = values[start:start + _PROCESSED_QUERY_BATCH]
+            rows = conn.execute(
+                f'SELECT hash, {", ".join(_PROCESSED_COLUMNS)} FROM processed '
+                f'WHERE {column} IN ({", ".join("?" * len(batch))}) ORDER BY processed_date',
+                batch
+            )
+            found.extend((row[0], _row_to_info(row[1:])) for row in rows)
+    return found
+
+
+def lookup_processed_files(file_hashes: List[str]) -> Dict[str, dict]:
+    """Return {hash: info} for those of `file_hashes` that have been processed."""
+    return dict(_query_processed('hash', file_hashes))
+
+
+def lookup_processed_md5s(md5s: List[str]) -> Dict[str, dict]:
+    """Return {md5: info} for those of the MD5 content hashes that have been processed."""
+    return {info['content_md5']: info for _, info in _query_processed('content_md5', md5s)}
+
 
 def save_processed_files(processed: Dict[str, dict]):
-    """Save the database of processed files."""
-    try:
-        with open(PROCESSED_FILES_DB, 'w') as f:
-            json.dump(processed, f, indent=2)
-    except Exception as e:
-        print(f"Warning: Could not save processed files database: {e}")
+    """Replace the database of processed files with `processed`."""
+    with _PROCESSED_LOCK:
+        _write_records(_get_processed_db(), processed, replace=True)
+
 
+def append_processed_record(file_hash: str, info: Optional[dict]):
+    """Record `info` for `file_hash`, or delete its entry if `info` is None."""
+    with _PROCESSED_LOCK:
+        conn = _get_processed_db()
+        if info is None:
+            conn.execute('DELETE FROM processed WHERE hash = ?', (file_hash,))
+        else:
+            _write_records(conn, {file_hash: info})
+
+
+def _file_stamp(filepath: Path) -> dict:
+    """Size and modification time, used to recognise an unchanged file without hashing it."""
+    st = filepath.stat()
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
 
-def mark_file_as_processed(filepath: Path, file_hash: str):
-    """Mark a file as processed."""
-    from datetime import datetime
+
+def mark_file_as_processed(filepath: Path, file_hash: str, content_md5: str = None):
+    """
+    Mark a file as processed.
     
-    processed = load_processed_files()
-    processed[file_hash] = {
+    `content_md5` is computed from the file when not given.
+    """
+    append_processed_record(file_hash, {
         'filename': filepath.name,
         'processed_date': datetime.now().isoformat(),
-        'file_path': str(filepath)
-    }
-    save_processed_files(processed)
+        'file_path': str(filepath),
+        'hash_algo': FILE_HASH_ALGO,
+        **_file_stamp(filepath),
+        'content_md5': content_md5 or get_legacy_file_hash(filepath)
+    })
 
 def is_file_processed(file_hash: str) -> bool:
     """Check if a file has been processed."""
-    processed = load_processed_files()
-    return file_hash in processed
+    with _PROCESSED_LOCK:
+        row = _get_processed_db().execute('SELECT 1 FROM processed WHERE hash = ?', (file_hash,)).fetchone()
+    return row is not None
+
+
+def _legacy_filenames() -> set:
+    """Filenames of the records still keyed by the old MD5 hash."""
+    with _PROCESSED_LOCK:
+        rows = _get_processed_db().execute(
+            'SELECT DISTINCT filename FROM processed WHERE hash_algo IS NOT ?', (FILE_HASH_ALGO,)
+        ).fetchall()
+    return {row[0] for row in rows}
 
 
 
@@ -202,6 +527,13 @@ def get_unprocessed_files(pdf_files: List[Path]) -> List[Path]:
     """
     Filter list of PDF files to only include unprocessed ones.
     
+    A file whose path, size and mtime match its processed record is taken
+    as unchanged and not re-hashed; all other files are identified by hash.
+    The MD5 kept for the Drive download prefilter is computed in the same
+    pass, so no file is read twice. Records keyed by the old MD5 hash are
+    only probed for files with the same name, so stale legacy records don't
+    add an MD5 to every new file.
+    
     Args:
         pdf_files: List of PDF file paths
         
@@ -209,15 +541,62 @@ def get_unprocessed_files(pdf_files: List[Path]) -> List[Path]:
         List of unprocessed PDF file paths
     """
     unprocessed = []
-    processed_db = load_processed_files()
     
     print(f"\nChecking {len(pdf_files)} file(s) against processed database...")
     
-    for pdf_file in pdf_files:
-        file_hash = get_file_hash(pdf_file)
-        
+    stamps = [_file_stamp(p) for p in pdf_files]
+    by_path = {info['file_path']: (file_hash, info)
+               for file_hash, info in _query_processed('file_path', [str(p) for p in pdf_files])}
+    
+    file_hashes = []
+    md5s = []
+    for pdf_file, stamp in zip(pdf_files, stamps):
+        file_hash, info = by_path.get(str(pdf_file), (None, None))
+        unchanged = info is not None and all(info.get(k) == v for k, v in stamp.items())
+        file_hashes.append(file_hash if unchanged else None)
+        md5s.append(info.get('content_md5') if unchanged else None)
+    
+    legacy_names = _legacy_filenames()
+    
+    def _hashes(i):
+        # MD5 is only needed for a missing content_md5 or a possible legacy record
+        if (file_hashes[i] is not None and md5s[i] is None) or pdf_files[i].name in legacy_names:
+            return get_file_hashes(pdf_files[i])
+        return get_file_hash(pdf_files[i]), md5s[i]
+    
+    # hashlib releases the GIL while hashing, so threads hash files in parallel
+    to_hash = [i for i, (file_hash, md5) in enumerate(zip(file_hashes, md5s)) if file_hash is None or md5 is None]
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor:
+        for i, (file_hash, md5) in zip(to_hash, executor.map(_hashes, to_hash)):
+            file_hashes[i] = file_hash
+            md5s[i] = md5
+    
+    processed_db = lookup_processed_files(file_hashes)
+    
+    # Re-key records written with the old MD5 hash instead of reprocessing
+    legacy_md5s = [md5 for file_hash, md5 in zip(file_hashes, md5s)
+                   if md5 and file_hash not in processed_db] if legacy_names else []
+    legacy = {md5: info for md5, info in lookup_processed_files(legacy_md5s).items()
+              if info.get('hash_algo') != FILE_HASH_ALGO}
+    for file_hash, md5 in zip(file_hashes, md5s):
+        if md5 in legacy and file_hash not in processed_db:
+            info = dict(legacy[md5], hash_algo=FILE_HASH_ALGO, content_md5=md5)
+            append_processed_record(md5, None)
+            append_processed_record(file_hash, info)
+            processed_db[file_hash] = info
+    
+    for pdf_file, file_hash, md5, stamp in zip(pdf_files, file_hashes, md5s, stamps):
         if file_hash in processed_db:
             prev_processed = processed_db[file_hash]
+            updates = {}
+            if prev_processed.get('file_path') == str(pdf_file) and any(prev_processed.get(k) != v for k, v in stamp.items()):
+                # Record the current size/mtime so the next run can skip hashing this file
+                updates.update(stamp)
+            if not prev_processed.get('content_md5'):
+                # Record the MD5 so the next run can skip downloading this file
+                updates['content_md5'] = md5 or get_legacy_file_hash(pdf_file)
+            if updates:
+                append_processed_record(file_hash, {**prev_processed, **updates})
             print(f"  ⊗ SKIP: {pdf_file.name} (already processed on {prev_processed['processed_date'][:10]})")
         else:
             print(f"  ✓ NEW:  {pdf_file.name}")
@@ -231,6 +610,28 @@ def get_unprocessed_files(pdf_files: List[Path]) -> List[Path]:
     return unprocessed
 
 
+def _pdf_cache_key(pdf_bytes: bytes) -> str:
+    """
+    Build the response cache key from the PDF content and the prompt/model.
+    
+    BLAKE2b is used for speed; the key only needs to be unique, not secure.
+    """
+    pdf_hash = hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+    return hashlib.blake2b(f'{pdf_hash}:{PROMPT_HASH}'.encode('ascii'), digest_size=16).hexdigest()
+
+
+def load_cached_response(cache_path: Path):
+    """Load a cached Gemini response, or return None if missing or unreadable."""
+    if not cache_path.exists():
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            return orjson.loads(f.read())
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable cache entry {cache_path.name}: {e}")
+        return None
+
+
 def list_processed_files():
     """Display all processed files."""
     processed = load_processed_files()
@@ -253,7 +654,8 @@ def list_processed_files():
 def reset_processed_files():
     """Clear the processed files database."""
     if PROCESSED_FILES_DB.exists():
-        PROCESSED_FILES_DB.unlink()
+        # Empty the table rather than deleting the file, so an old ledger is not re-imported
+        save_processed_files({})
         print("✓ Processed files database cleared.")
     else:
         print("No database to clear.")
@@ -273,26 +675,57 @@ def remove_file_from_processed(filename: str):
         return
     
     for file_hash in found:
-        del processed[file_hash]
+        append_processed_record(file_hash, None)
         print(f"✓ Removed: {filename}")
-    
-    save_processed_files(processed)
 
 
 #--------------------------------------------------------
 
 def extract_folder_id(folder_input: str) -> str:
     """Extract folder ID from URL or return as-is if already an ID."""
-    match = re.search(r'folders/([A-Za-z0-9_-]+)', folder_input)
+    match = _FOLDER_RE.search(folder_input)
     if match:
         return match.group(1)
     # Assume it's already a folder ID
     return folder_input.strip()
 
-def download_pdfs_from_drive(folder_id: str, output_dir: Path) -> list:
+def list_drive_md5s(folder_id: str, api_key: str) -> Dict[str, str]:
     """
-    Download ALL files from Drive folder (no date filtering).
-    This replaces the download_pdfs_from_drive function.
+    Return {file_id: md5Checksum} for the files in a public Drive folder.
+    
+    Uses the Drive v3 files listing, which needs an API key but reports
+    content checksums without downloading anything.
+    """
+    md5s = {}
+    params = {
+        'q': f"'{folder_id}' in parents and trashed = false",
+        'fields': 'nextPageToken, files(id, md5Checksum)',
+        'pageSize': 1000,
+    }
+    # Send the key as a header so it never appears in the URL (or in error messages)
+    headers = {'X-Goog-Api-Key': api_key}
+    while True:
+        response = requests.get(DRIVE_FILES_URL, params=params, headers=headers, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        for f in data.get('files', []):
+            if f.get('md5Checksum'):
+                md5s[f['id']] = f['md5Checksum']
+        if not data.get('nextPageToken'):
+            return md5s
+        params['pageToken'] = data['nextPageToken']
+
+
+def download_pdfs_from_drive(folder_id: str, output_dir: Path, max_workers: int = DEFAULT_DOWNLOAD_WORKERS) -> list:
+    """
+    Download ALL PDFs from Drive folder (no date filtering).
+    
+    The folder is listed once, then files are fetched concurrently on a
+    thread pool of `max_workers` threads instead of one at a time.
+    
+    If DRIVE_API_KEY is set, Drive's MD5 checksums are compared with the
+    processed files database first and already processed PDFs are not
+    downloaded at all.
     """
     
     output_dir.mkdir(exist_ok=True)
@@ -301,19 +734,59 @@ def download_pdfs_from_drive(folder_id: str, output_dir: Path) -> list:
     # existing_names = {p.name for p in output_dir.glob("*.pdf")}
     
     # # Clean previous downloads
-    # for f in output_dir.glob('*'):
-    #     if f.is_file():
-    #         f.unlink()
+    # with os.scandir(output_dir) as entries:
+    #     for entry in entries:
+    #         if entry.is_file(follow_symlinks=False):
+    #             os.unlink(entry.path)
     
     url = f'https://drive.google.com/drive/folders/{folder_id}'
     print(f'\n[1/4] Downloading ALL PDFs from Google Drive folder: {url}')
     
     try:
-        gdown.download_folder(url, output=str(output_dir), quiet=False)
+        drive_files = gdown.download_folder(url, output=str(output_dir), quiet=True, skip_download=True)
     except Exception as e:
-        print(f'Error downloading folder: {e}')
+        print(f'Error listing folder: {e}')
         return []
     
+    drive_files = [f for f in drive_files or [] if f.path.lower().endswith('.pdf')]
+    print(f'Found {len(drive_files)} PDF(s)')
+    
+    drive_api_key = os.environ.get('DRIVE_API_KEY')
+    if drive_api_key and drive_files:
+        try:
+            drive_md5s = list_drive_md5s(folder_id, drive_api_key)
+            processed_md5s = lookup_processed_md5s(sorted(set(drive_md5s.values())))
+            remaining = []
+            for drive_file in drive_files:
+                info = processed_md5s.get(drive_md5s.get(drive_file.id))
+                if info:
+                    print(f'  ⊗ SKIP: {drive_file.path} (already processed on {info["processed_date"][:10]})')
+                else:
+                    remaining.append(drive_file)
+            drive_files = remaining
+        except Exception as e:
+            print(f'Warning: Could not check Drive checksums, downloading all files: {e}')
+    
+    print(f'Downloading {len(drive_files)} PDF(s) with {max_workers} worker(s)...')
+    
+    def _download(drive_file):
+        Path(drive_file.local_path).parent.mkdir(parents=True, exist_ok=True)
+        # The folder is public, and gdown's shared cookie file is not safe to
+        # load and rewrite from several threads at once
+        return gdown.download(id=drive_file.id, output=drive_file.local_path, quiet=True, use_cookies=False)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_download, f): f for f in drive_files}
+        for future in as_completed(futures):
+            drive_file = futures[future]
+            try:
+                if future.result() is None:
+                    print(f'  ✗ Failed: {drive_file.path}')
+                else:
+                    print(f'  ✓ Downloaded: {drive_file.path}')
+            except Exception as e:
+                print(f'  ✗ Failed: {drive_file.path}: {e}')
+    
     pdf_files = sorted(output_dir.glob('*.pdf'))
     print(f'Downloaded {len(pdf_files)} PDF(s)')
     
@@ -324,15 +797,6 @@ def download_pdfs_from_drive(folder_id: str, output_dir: Path) -> list:
 
 #------------------------------------------------
 
-def extract_folder_id(folder_input: str) -> str:
-    """Extract folder ID from URL or return as-is if already an ID."""
-    match = re.search(r'folders/([A-Za-z0-9_-]+)', folder_input)
-    if match:
-        return match.group(1)
-    # Assume it's already a folder ID
-    return folder_input.strip()
-
-
 def extract_text_from_response(response):
     """Robustly extract text from Gemini API response."""
     json_output = None
@@ -364,55 +828,195 @@ def extract_text_from_response(response):
     return json_output
 
 
-def wait_for_file_processing(file_ref, poll_interval=2, timeout=120):
-    """Wait for uploaded file to finish processing."""
+def wait_for_file_processing(file_ref, poll_interval=2, timeout=120, initial_interval=0.2,
+                             first_probe=0.1):
+    """
+    Wait for uploaded file to finish processing.
+    
+    The first status check comes after a jittered `first_probe` delay, so
+    small files are picked up almost immediately and concurrent uploads do
+    not poll in lockstep. Later checks back off exponentially from
+    `initial_interval`, capped at `poll_interval`.
+    """
     start = time.time()
+    delay = first_probe * random.uniform(0.5, 1.5)
+    next_delay = initial_interval
     while getattr(file_ref.state, 'name', '') == 'PROCESSING':
         if time.time() - start > timeout:
             raise TimeoutError(f'Timeout waiting for file {file_ref.name}')
-        time.sleep(poll_interval)
+        time.sleep(delay)
+        delay, next_delay = next_delay, min(poll_interval, next_delay * 2)
         file_ref = genai.get_file(file_ref.name)
     return file_ref
 
 
-def process_pdf_with_gemini(pdf_path: Path, model) -> dict:
-    """Upload PDF to Gemini, extract content, and return parsed JSON or raw text."""
-    print(f'  Uploading: {pdf_path.name}')
-    pdf_file = genai.upload_file(str(pdf_path))
-    print(f'  Uploaded: {pdf_file.name}')
+def prompt_cache_supported() -> bool:
+    """Whether PROMPT can be cached on GEMINI_MODEL, judged locally without an API call."""
+    if GEMINI_MODEL.endswith('-latest'):
+        return False
+    return len(PROMPT) // CHARS_PER_TOKEN >= PROMPT_CACHE_MIN_TOKENS
+
+
+def create_prompt_cache():
+    """
+    Register PROMPT once as Gemini cached content.
     
-    pdf_file = wait_for_file_processing(pdf_file)
-    if pdf_file.state.name == 'FAILED':
-        raise ValueError(f'File processing failed for {pdf_path.name}')
+    Returns None when caching is unavailable, in which case PROMPT is sent
+    inline. Models and prompts that prompt_cache_supported() rules out are
+    skipped without a request.
+    """
+    if not prompt_cache_supported():
+        return None
+    try:
+        cache = genai.caching.CachedContent.create(
+            model=GEMINI_MODEL,
+            system_instruction=PROMPT,
+            ttl=PROMPT_CACHE_TTL
+        )
+        print(f'  Prompt cached as {cache.name}')
+        return cache
+    except Exception as e:
+        print(f'  Prompt caching unavailable, sending prompt with each request: {e}')
+        return None
+
+
+def keep_prompt_cache_alive(cache, stop: threading.Event):
+    """Extend the prompt cache TTL periodically until `stop` is set."""
+    while not stop.wait(PROMPT_CACHE_REFRESH_SECONDS):
+        try:
+            cache.update(ttl=PROMPT_CACHE_TTL)
+        except Exception as e:
+            print(f'Warning: Could not refresh prompt cache: {e}')
+
+
+def process_pdf_with_gemini(pdf_path: Path, model, request_limiter: RateLimiter = None,
+                            token_limiter: RateLimiter = None, pdf_bytes: bytes = None,
+                            poll_interval: float = 2) -> dict:
+    """
+    Send PDF to Gemini, extract content, and return parsed JSON or raw text.
     
-    print(f'  Extracting content...')
-    response = model.generate_content([PROMPT, pdf_file])
+    PDFs smaller than INLINE_PDF_MAX_BYTES are sent inline with the request,
+    skipping the File API upload and processing poll. Larger PDFs, and inline
+    requests Gemini rejects as invalid (e.g. too large), are uploaded first
+    and polled until ready, at most every `poll_interval` seconds. If `pdf_bytes` is given it is used instead of re-reading
+    `pdf_path`. If `model` was built from a prompt cache, PROMPT is not sent again.
+    """
+    def _throttle(tokens=0):
+        if request_limiter:
+            request_limiter.acquire()
+        if token_limiter and tokens:
+            token_limiter.acquire(tokens)
+    
+    def _upload():
+        if pdf_bytes is None:
+            return genai.upload_file(str(pdf_path))
+        return genai.upload_file(io.BytesIO(pdf_bytes), mime_type='application/pdf', display_name=pdf_path.name)
+    
+    def _uploaded_part():
+        print(f'  Uploading: {pdf_path.name}')
+        file_ref = call_with_backoff(_upload, before_attempt=_throttle)
+        print(f'  Uploaded: {file_ref.name}')
+        
+        file_ref = wait_for_file_processing(file_ref, poll_interval=poll_interval)
+        if file_ref.state.name == 'FAILED':
+            raise ValueError(f'File processing failed for {pdf_path.name}')
+        return file_ref
+    
+    def _generate(pdf_part):
+        print(f'  Extracting content: {pdf_path.name}')
+        contents = [pdf_part] if model.cached_content else [PROMPT, pdf_part]
+        return call_with_backoff(
+            model.generate_content, contents,
+            before_attempt=lambda: _throttle(ESTIMATED_TOKENS_PER_REQUEST)
+        )
+    
+    size = len(pdf_bytes) if pdf_bytes is not None else pdf_path.stat().st_size
+    if size < INLINE_PDF_MAX_BYTES:
+        if pdf_bytes is None:
+            pdf_bytes = pdf_path.read_bytes()
+        try:
+            response = _generate({'mime_type': 'application/pdf', 'data': pdf_bytes})
+        except google_exceptions.InvalidArgument as e:
+            # Typically the request is over the inline payload limit
+            print(f'  Inline request rejected for {pdf_path.name} ({e}); using the File API')
+            response = _generate(_uploaded_part())
+    else:
+        response = _generate(_uploaded_part())
+    if token_limiter:
+        # Replace the reserved estimate with the tokens actually billed
+        usage = getattr(response, 'usage_metadata', None)
+        used = getattr(usage, 'total_token_count', 0) or 0
+        if used:
+            token_limiter.adjust(used - ESTIMATED_TOKENS_PER_REQUEST)
     text = extract_text_from_response(response)
     
     # Try to parse JSON
     parsed = None
     try:
-        parsed = json.loads(text)
+        parsed = orjson.loads(text)
     except Exception:
         # Try stripping markdown code fences
         t = text.strip()
         if t.startswith('```'):
-            t = t.replace('```json', '').replace('```', '').strip()
+            # Strip only the outer fence; slicing keeps Python 3.8 support
+            t = t[len('```json'):] if t.startswith('```json') else t[len('```'):]
+            if t.endswith('```'):
+                t = t[:-len('```')]
+            t = t.strip()
         try:
-            parsed = json.loads(t)
+            parsed = orjson.loads(t)
         except Exception:
             parsed = text  # Return raw text if parsing fails
     
     return parsed
 
 
-def process_all_pdfs(pdf_files: list, output_dir: Path) -> list:
-    """Process all PDFs and save individual JSON outputs."""
+def process_all_pdfs(pdf_files: list, output_dir: Path, max_workers: int = DEFAULT_MAX_WORKERS,
+                     rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM, use_cache: bool = True,
+                     pretty: bool = False, processed_marks: list = None) -> list:
+    """
+    Process all PDFs concurrently and save individual JSON outputs.
+    
+    Returns the (basename, parsed, err) results of iter_process_pdfs, in
+    completion order.
+    """
+    return list(iter_process_pdfs(pdf_files, output_dir, max_workers, rpm, tpm,
+                                  use_cache, pretty, processed_marks))
+
+
+def iter_process_pdfs(pdf_files: list, output_dir: Path, max_workers: int = DEFAULT_MAX_WORKERS,
+                      rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM, use_cache: bool = True,
+                      pretty: bool = False, processed_marks: list = None) -> Iterator[tuple]:
+    """
+    Extract PDFs concurrently, yielding (basename, parsed, err) as each one finishes.
+    
+    Results are yielded on the calling thread in completion order, so the
+    caller can write each voucher's rows while the remaining PDFs are still
+    being extracted. Closing the generator early cancels the queued PDFs.
+    
+    Gemini calls are network-bound, so PDFs are extracted on a thread pool of
+    `max_workers` threads. All workers share one requests-per-minute and one
+    tokens-per-minute limiter. Each worker writes its JSON file and records
+    the PDF as processed as soon as its extraction completes.
+    
+    If `processed_marks` is given, (pdf_path, file_hash, content_md5) is
+    appended to it instead, so the caller can mark the PDFs processed only
+    once their rows are saved.
+    
+    Successful extractions are cached in RESPONSE_CACHE_DIR, keyed by PDF
+    content and prompt, so unchanged PDFs are not sent to Gemini again.
+    
+    JSON is written compact; pass `pretty` to indent the files in
+    `output_dir` for reading (the cache stays compact).
+    """
     output_dir.mkdir(exist_ok=True)
+    RESPONSE_CACHE_DIR.mkdir(exist_ok=True)
     
     # Clean previous JSON outputs
-    for f in output_dir.glob('*.json'):
-        f.unlink()
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.json') and entry.is_file(follow_symlinks=False):
+                os.unlink(entry.path)
     
     api_key = os.environ.get('GENAI_API_KEY')
     if not api_key:
@@ -420,35 +1024,219 @@ def process_all_pdfs(pdf_files: list, output_dir: Path) -> list:
         sys.exit(1)
     
     genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-flash-latest')
     
-    print(f'\n[2/4] Processing {len(pdf_files)} PDF(s) with Gemini...')
+    print(f'\n[2/4] Processing {len(pdf_files)} PDF(s) with Gemini ({max_workers} worker(s))...')
+    
+    request_limiter = RateLimiter(rpm)
+    token_limiter = RateLimiter(tpm)
+    
+    # The prompt cache is only created once a PDF misses the response cache
+    prompt_cache_lock = threading.Lock()
+    prompt_cache_state = {}
+    stop_refresh = threading.Event()
+    
+    def _get_prompt_cache():
+        with prompt_cache_lock:
+            if 'cache' not in prompt_cache_state:
+                cache = prompt_cache_state['cache'] = create_prompt_cache()
+                if cache:
+                    threading.Thread(
+                        target=keep_prompt_cache_alive,
+                        args=(cache, stop_refresh),
+                        daemon=True
+                    ).start()
+            return prompt_cache_state['cache']
+    
+    # Poll uploads more often when several are in flight so no worker idles long
+    poll_interval = CONCURRENT_POLL_INTERVAL if max_workers > 1 and len(pdf_files) > 1 else 2
+    
+    # GenerativeModel is not documented as thread-safe, so keep one per thread
+    thread_state = threading.local()
     
-    results = []
-    for pdf_path in pdf_files:
+    def _process_one(pdf_path: Path):
+        """Extract one PDF, save its JSON and mark it processed."""
         basename = pdf_path.stem
         json_path = output_dir / f'{basename}.json'
-        
         try:
-            parsed = process_pdf_with_gemini(pdf_path, model)
-            
-            # Save JSON output
-            with open(json_path, 'w', encoding='utf-8') as f:
+            # Read once; the same bytes feed the cache key, the ledger hash and the upload
+            pdf_bytes = pdf_path.read_bytes()
+            cache_path = RESPONSE_CACHE_DIR / f'{_pdf_cache_key(pdf_bytes)}.json'
+            parsed = load_cached_response(cache_path) if use_cache else None
+            if parsed is not None:
+                if pretty:
+                    json_path.write_bytes(orjson.dumps(parsed, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+                else:
+                    shutil.copy(cache_path, json_path)
+                cached = True
+            else:
+                cached = False
+                model = getattr(thread_state, 'model', None)
+                if model is None:
+                    prompt_cache = _get_prompt_cache()
+                    if prompt_cache:
+                        model = genai.GenerativeModel.from_cached_content(prompt_cache)
+                    else:
+                        model = genai.GenerativeModel(GEMINI_MODEL)
+                    thread_state.model = model
+                parsed = process_pdf_with_gemini(pdf_path, model, request_limiter, token_limiter,
+                                                 pdf_bytes, poll_interval)
+                
+                # Save JSON output; compact unless pretty, reusing the bytes for the cache
                 if isinstance(parsed, dict):
-                    json.dump(parsed, f, indent=2, ensure_ascii=False)
+                    payload = orjson.dumps(parsed, option=orjson.OPT_NON_STR_KEYS)
+                    cache_path.write_bytes(payload)
+                    if pretty:
+                        payload = orjson.dumps(parsed, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+                    json_path.write_bytes(payload)
                 else:
-                    f.write(str(parsed))
-            
-            print(f'  ✓ Saved: {json_path.name}')
-            results.append((basename, parsed, None))
-            file_hash = get_file_hash(pdf_path)
-            mark_file_as_processed(pdf_path, file_hash)
+                    # Only responses that parsed as JSON are cached
+                    json_path.write_text(str(parsed), encoding='utf-8')
             
+            mark = (pdf_path, get_bytes_hash(pdf_bytes), get_bytes_md5(pdf_bytes))
+            if processed_marks is None:
+                mark_file_as_processed(*mark)
+            else:
+                processed_marks.append(mark)
+            return basename, parsed, None, cached
         except Exception as e:
-            print(f'  ✗ Error processing {pdf_path.name}: {e}')
-            results.append((basename, None, str(e)))
+            return basename, None, str(e), False
     
-    return results
+    try:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {executor.submit(_process_one, pdf_path): pdf_path for pdf_path in pdf_files}
+        try:
+            for future in as_completed(futures):
+                basename, parsed, err, cached = future.result()
+                if err is not None:
+                    print(f'  ✗ Error processing {futures[future].name}: {err}')
+                else:
+                    print(f'  ✓ Saved: {basename}.json' + (' (cached)' if cached else ''))
+                yield basename, parsed, err
+        except BaseException:
+            # Don't send the queued PDFs to Gemini on Ctrl-C or when the consumer stops
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown(wait=True)
+    finally:
+        stop_refresh.set()
+        prompt_cache = prompt_cache_state.get('cache')
+        if prompt_cache:
+            try:
+                prompt_cache.delete()
+            except Exception as e:
+                print(f'Warning: Could not delete prompt cache: {e}')
+
+
+# Keys (or nested key paths) tried in order to locate each voucher section
+PV_ROOT_KEYS = ('payment_voucher', 'PaymentVoucher')
+PV_GENERAL_KEYS = (
+    ('voucher_details', 'general_info'), 'general_details', 'voucher_metadata', 'reference_details',
+    'general_information', 'VoucherDetails', 'HeaderInfo',
+)
+PV_ITEMS_KEYS = (
+    'details_of_bills_claimed', 'bills_claimed_details', ('bill_details', 'items_claimed'),
+    ('claimed_items', 'items'), ('details_of_bills', 'items'), 'items', 'details',
+    ('ItemDetails', 'BillsClaimed'), 'ItemDetails',
+)
+PV_AMOUNT_KEYS = (
+    'amount_summary', 'financial_summary', 'amount_details',
+    ('details_of_bills', 'amount_summary'), ('bill_details', 'amount_summary'), 'FinancialSummary',
+)
+PV_PROJECT_KEYS = ('project_fund_details', 'project_details', 'ProjectFundDetails')
+PV_ADMIN_KEYS = ('administrative_approvals', 'AccountingClassification')
+
+# Alias keys tried (in order) for each voucher field, across the schema variants Gemini returns
+FIELD_ALIASES = {
+    # general details
+    'unique_reference_number': ('unique_reference_number', 'UniqueReferenceNumber'),
+    'invoice_no': ('invoice_no', 'InvoiceNo'),
+    'invoice_date': ('invoice_date', 'InvoiceDate'),
+    'supplier': ('name_of_the_supplier', 'supplier_name', 'SupplierName'),
+    'payment_to': ('payment_to_be_made_in_the_name_of', 'payment_to_name', 'payment_to_be_made_in_name_of', 'PaymentInNameOf'),
+    'purchase_type': ('purchase_type', 'PurchaseType'),
+    # items
+    'type_of_stock': ('type_of_stock', 'TypeOfStock', 'TypeofStock_Asset_ConsService'),
+    'subcategory': ('subcategory_of_the_stock', 'subcategory_of_stock', 'SubcategoryOfStock'),
+    'item_name': ('item_name', 'item_description', 'description_item_name', 'description', 'Description', 'ItemName'),
+    'net_amount': ('net_amount', 'net_amount_inr', 'NetAmount'),
+    'remarks': ('remarks', 'Remarks'),
+    # amount summary
+    'total_amount': ('total_amount_in_inr', 'total_amount_inr', 'total_amount', 'TotalAmountINR'),
+    'advance_taken': ('advance_taken_in_inr', 'advance_taken_inr', 'advance_taken', 'AdvanceTakenINR'),
+    'penalty_deducted': ('penalty_deducted_in_inr', 'penalty_deducted_inr', 'penalty_deducted', 'PenaltyDeductedINR'),
+    'net_payable': ('net_amount_payable_in_figure_inr', 'net_amount_payable_figure_inr', 'net_amount_payable', 'NetAmountPayableFigureINR'),
+    'net_payable_words': ('net_amount_payable_in_words_inr', 'net_amount_payable_words_inr', 'net_amount_payable_words', 'NetAmountPayableWordsINR'),
+    # project details
+    'project_no': ('project_no', 'ProjectNo'),
+    'project_title': ('project_title', 'ProjectTitle'),
+    'source_of_payment': ('source_of_payment', 'SourceOfPayment'),
+    'head_of_expense': ('head_of_expense', 'HeadOfExpense'),
+    'balance_in_project': ('balance_in_project', 'BalanceInProject'),
+    'overhead_deducted': ('overhead_deducted', 'OverheadDeducted'),
+}
+
+# Row columns taken from each source dict, in row order
+GEN_ROW_FIELDS = ('unique_reference_number', 'invoice_no', 'invoice_date', 'supplier', 'payment_to', 'purchase_type')
+ITEM_ROW_FIELDS = ('type_of_stock', 'subcategory', 'item_name', 'net_amount', 'remarks')
+AMOUNT_ROW_FIELDS = ('total_amount', 'advance_taken', 'penalty_deducted', 'net_payable', 'net_payable_words')
+PROJ_ROW_FIELDS = ('balance_in_project', 'overhead_deducted')
+
+
+def first(d: dict, keys: tuple):
+    """Return the first present value for `keys` in `d`, skipping None, '' and empty containers (0 is kept)."""
+    for key in keys:
+        value = d.get(key)
+        if value is None or value == '' or (isinstance(value, (dict, list)) and not value):
+            continue
+        return value
+    return ''
+
+
+def pick(d: dict, field: str):
+    """Return the value of `field` in `d`, trying each of its FIELD_ALIASES in order."""
+    return first(d, FIELD_ALIASES[field])
+
+
+def _get_path(d: dict, key):
+    """Look up a key, or a tuple of nested keys, returning None if any level is missing."""
+    if isinstance(key, str):
+        return d.get(key)
+    for k in key:
+        if not isinstance(d, dict):
+            return None
+        d = d.get(k)
+    return d
+
+
+def first_section(d: dict, keys: tuple, types=dict, default=None):
+    """Return the first non-empty value of type `types` found at `keys` in `d`, or `default`."""
+    return next(
+        (v for v in (_get_path(d, k) for k in keys) if v and isinstance(v, types)),
+        {} if default is None else default
+    )
+
+
+def first_dict(d: dict, keys: tuple) -> dict:
+    """Return the first non-empty dict found at `keys` in `d`, or {}."""
+    return first_section(d, keys, dict)
+
+
+def _flatten(v):
+    """
+    Reduce a JSON value to a scalar Excel cell.
+    
+    {'selected': x} becomes x, lists of scalars are joined with ', ' and any
+    other dict/list is serialized as compact JSON.
+    """
+    if isinstance(v, dict):
+        if 'selected' in v:
+            return _flatten(v['selected'])
+        return orjson.dumps(v).decode()
+    if isinstance(v, list):
+        if all(not isinstance(x, (dict, list)) for x in v):
+            return ', '.join(str(x) for x in v if x is not None)
+        return orjson.dumps(v).decode()
+    return v
 
 
 def build_rows_from_parsed(parsed, source_pdf: str) -> list:
@@ -461,7 +1249,7 @@ def build_rows_from_parsed(parsed, source_pdf: str) -> list:
     # Handle raw string
     if isinstance(parsed, str):
         try:
-            parsed = json.loads(parsed)
+            parsed = orjson.loads(parsed)
         except Exception:
             preview = parsed.replace('\n', ' ')[:300]
             rows.append([source_pdf] + [''] * 10 + [f'PARSE_FAILED: {preview}'] + [''] * 11)
@@ -471,71 +1259,33 @@ def build_rows_from_parsed(parsed, source_pdf: str) -> list:
         return rows
     
     # Navigate the JSON structure - handle different naming conventions
-    pv = (
-        parsed.get('payment_voucher') or
-        parsed.get('PaymentVoucher') or
-        parsed
-    )
+    pv = first_dict(parsed, PV_ROOT_KEYS) or parsed
     
-    # Try different key patterns for general details
-    gen = (
-        pv.get('general_details', {}) or
-        pv.get('voucher_metadata', {}) or
-        pv.get('reference_details', {}) or
-        pv.get('general_information', {}) or
-        pv.get('VoucherDetails', {}) or
-        pv.get('HeaderInfo', {})
-    )
-    
-    # Try different key patterns for items
-    items = (
-        pv.get('details_of_bills_claimed', []) or
-        pv.get('bills_claimed_details', []) or
-        pv.get('bill_details', {}).get('items_claimed', []) or
-        pv.get('claimed_items', {}).get('items', []) or
-        pv.get('details_of_bills', {}).get('items', []) or
-        pv.get('items', []) or
-        pv.get('details', []) or
-        pv.get('ItemDetails', {}).get('BillsClaimed', []) or
-        pv.get('ItemDetails', [])
-    )
+    # Try different key patterns for each section
+    gen = first_dict(pv, PV_GENERAL_KEYS)
+    items = first_section(pv, PV_ITEMS_KEYS, (list, dict), [])
     # Ensure items is a list
     if isinstance(items, dict):
         items = items.get('items', []) or items.get('BillsClaimed', []) or items.get('items_claimed', []) or []
-    
-    # Try different key patterns for amount summary
-    amount = (
-        pv.get('amount_summary', {}) or
-        pv.get('financial_summary', {}) or
-        pv.get('amount_details', {}) or
-        pv.get('details_of_bills', {}).get('amount_summary', {}) or
-        pv.get('bill_details', {}).get('amount_summary', {}) or
-        pv.get('FinancialSummary', {})
-    )
-    
-    # Try different key patterns for project details
-    proj = (
-        pv.get('project_fund_details', {}) or
-        pv.get('project_details', {}) or
-        pv.get('ProjectFundDetails', {})
-    )
+    amount = first_dict(pv, PV_AMOUNT_KEYS)
+    proj = first_dict(pv, PV_PROJECT_KEYS)
     
     # Extract project_no and project_title from nested structure if needed
-    project_no = proj.get('project_no', '') or proj.get('ProjectNo', '')
-    project_title = proj.get('project_title', '') or proj.get('ProjectTitle', '')
-    if not project_no and 'items' in proj:
-        for item in proj.get('items', []):
+    project_no = pick(proj, 'project_no')
+    project_title = pick(proj, 'project_title')
+    if not project_no:
+        for item in proj.get('items') or proj.get('details_table') or []:
             if item.get('contents') == 'Project No':
                 project_no = item.get('details', '')
             elif item.get('contents') == 'Project Title':
                 project_title = item.get('details', '')
     
     # Extract source_of_payment and head_of_expense
-    source_of_payment = proj.get('source_of_payment', '') or proj.get('SourceOfPayment', '')
-    head_of_expense = proj.get('head_of_expense', '') or proj.get('HeadOfExpense', '')
+    source_of_payment = pick(proj, 'source_of_payment')
+    head_of_expense = pick(proj, 'head_of_expense')
     
     # Handle dict-based source/head (where keys are boolean)
-    admin = pv.get('administrative_approvals', {}) or pv.get('AccountingClassification', {})
+    admin = first_dict(pv, PV_ADMIN_KEYS)
     categorization = pv.get('categorization_of_expense', {})
     
     if isinstance(admin.get('source_of_payment'), dict):
@@ -550,156 +1300,221 @@ def build_rows_from_parsed(parsed, source_pdf: str) -> list:
         if isinstance(categorization.get('head_of_expense'), dict):
             head_of_expense = categorization['head_of_expense'].get('selected', '')
     
+    # Voucher-level columns are identical for every item, so resolve them once
+    head = [_flatten(v) for v in [source_pdf, *[pick(gen, f) for f in GEN_ROW_FIELDS]]]
+    tail = [_flatten(v) for v in [
+        *[pick(amount, f) for f in AMOUNT_ROW_FIELDS],
+        project_no,
+        project_title,
+        *[pick(proj, f) for f in PROJ_ROW_FIELDS],
+        source_of_payment,
+        head_of_expense
+    ]]
+    
     if not items:
-        # Single row for documents without itemized bills
-        row = [
-            source_pdf,
-            gen.get('unique_reference_number', ''),
-            gen.get('invoice_no', ''),
-            gen.get('invoice_date', ''),
-            gen.get('name_of_the_supplier', '') or gen.get('supplier_name', ''),
-            gen.get('payment_to_be_made_in_the_name_of', '') or gen.get('payment_to_name', ''),
-            gen.get('purchase_type', ''),
-            '', '',
-            '',
-            amount.get('net_amount_payable_in_figure_inr', '') or amount.get('net_amount_payable_figure_inr', ''),
-            '',
-            amount.get('total_amount_in_inr', ''),
-            amount.get('advance_taken_in_inr', ''),
-            amount.get('penalty_deducted_in_inr', ''),
-            amount.get('net_amount_payable_in_figure_inr', '') or amount.get('net_amount_payable_figure_inr', ''),
-            amount.get('net_amount_payable_in_words_inr', '') or amount.get('net_amount_payable_words_inr', ''),
-            project_no,
-            project_title,
-            proj.get('balance_in_project', ''),
-            proj.get('overhead_deducted', ''),
-            source_of_payment,
-            head_of_expense
-        ]
-        rows.append(row)
+        # Single row for documents without itemized bills; net payable stands in as the amount
+        rows.append(head + ['', '', '', _flatten(pick(amount, 'net_payable')), ''] + tail)
         return rows
     
     # One row per item
     for it in items:
-        row = [
-            source_pdf,
-            gen.get('unique_reference_number', '') or gen.get('UniqueReferenceNumber', ''),
-            gen.get('invoice_no', '') or gen.get('InvoiceNo', ''),
-            gen.get('invoice_date', '') or gen.get('InvoiceDate', ''),
-            gen.get('name_of_the_supplier', '') or gen.get('supplier_name', '') or gen.get('SupplierName', ''),
-            gen.get('payment_to_be_made_in_the_name_of', '') or gen.get('payment_to_name', '') or gen.get('payment_to_be_made_in_name_of', '') or gen.get('PaymentInNameOf', ''),
-            gen.get('purchase_type', '') or gen.get('PurchaseType', ''),
-            it.get('type_of_stock', '') or it.get('TypeOfStock', '') or it.get('TypeofStock_Asset_ConsService', ''),
-            it.get('subcategory_of_the_stock', '') or it.get('subcategory_of_stock', '') or it.get('SubcategoryOfStock', ''),
-            it.get('item_name', '') or it.get('description_item_name', '') or it.get('description', '') or it.get('Description', '') or it.get('ItemName', ''),
-            it.get('net_amount', '') or it.get('net_amount_inr', '') or it.get('NetAmount', ''),
-            it.get('remarks', '') or it.get('Remarks', ''),
-            amount.get('total_amount_in_inr', '') or amount.get('total_amount_inr', '') or amount.get('total_amount', '') or amount.get('TotalAmountINR', ''),
-            amount.get('advance_taken_in_inr', '') or amount.get('advance_taken_inr', '') or amount.get('advance_taken', '') or amount.get('AdvanceTakenINR', ''),
-            amount.get('penalty_deducted_in_inr', '') or amount.get('penalty_deducted_inr', '') or amount.get('penalty_deducted', '') or amount.get('PenaltyDeductedINR', ''),
-            amount.get('net_amount_payable_in_figure_inr', '') or amount.get('net_amount_payable_figure_inr', '') or amount.get('net_amount_payable', '') or amount.get('NetAmountPayableFigureINR', ''),
-            amount.get('net_amount_payable_in_words_inr', '') or amount.get('net_amount_payable_words_inr', '') or amount.get('net_amount_payable_words', '') or amount.get('NetAmountPayableWordsINR', ''),
-            project_no,
-            project_title,
-            proj.get('balance_in_project', '') or proj.get('BalanceInProject', ''),
-            proj.get('overhead_deducted', '') or proj.get('OverheadDeducted', ''),
-            source_of_payment,
-            head_of_expense
-        ]
-        rows.append(row)
+        rows.append(head + [_flatten(pick(it, f)) for f in ITEM_ROW_FIELDS] + tail)
     
     return rows
 
 
-def process_single_json(json_data: Dict[str, Any], source_pdf: str = "") -> List[Dict[str, Any]]:
+def iter_rows_from_json(json_data: Dict[str, Any], source_pdf: str = "") -> Iterator[tuple]:
+    """
+    Yield the Excel rows of a single JSON voucher, one per item.
+    
+    Section and field names are resolved through PV_*_KEYS and FIELD_ALIASES,
+    so any of the schema variants Gemini returns produce filled rows.
+    
+    Args:
+        json_data: Dictionary containing payment voucher data
+        source_pdf: Name of source PDF file
+        
+    Yields:
+        Row tuples in EXCEL_COLUMNS order
+    """
+    # Get current date for Date field
+    current_date = datetime.now().strftime('%d/%m/%Y')
+    
+    for row in build_rows_from_parsed(json_data, source_pdf):
+        yield (current_date, *row)
+
+
+def process_single_json(json_data: Dict[str, Any], source_pdf: str = "", as_dict: bool = False) -> list:
     """
     Process a single JSON voucher and return rows for Excel.
     
     Args:
         json_data: Dictionary containing payment voucher data
         source_pdf: Name of source PDF file
+        as_dict: If True, return each row as a {column: value} dictionary
         
     Returns:
-        List of row dictionaries
+        List of row tuples in EXCEL_COLUMNS order (dictionaries if as_dict)
+    """
+    rows = iter_rows_from_json(json_data, source_pdf)
+    if as_dict:
+        return [dict(zip(EXCEL_COLUMNS, row)) for row in rows]
+    return list(rows)
+
+
+def _read_json(json_file: Path):
+    """Read and parse one JSON file, returning the exception if it fails."""
+    try:
+        return orjson.loads(json_file.read_bytes())
+    except Exception as e:
+        return e
+
+
+def iter_json_files(json_files: List[Path], max_workers: int = JSON_READ_WORKERS) -> Iterator[tuple]:
     """
-    # Extract common fields from JSON
-    voucher = json_data.get('voucher_details', {})
-    general = voucher.get('general_info', {})
-    bill = json_data.get('bill_details', {})
-    amount = json_data.get('amount_summary', {})
-    project = json_data.get('project_fund_details', {})
+    Read and parse JSON files concurrently on a thread pool.
     
-    # Get items list
-    items = bill.get('items_claimed', [])
+    Yields (json_file, data) in the same order as `json_files`; a file that
+    could not be read or parsed yields its exception as data. Files are read
+    `max_workers` at a time, so only one batch is held in memory.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for start in range(0, len(json_files), max_workers):
+            batch = json_files[start:start + max_workers]
+            yield from zip(batch, executor.map(_read_json, batch))
+
+
+def write_excel(rows, output_file: Union[str, Path], columns: List[str] = EXCEL_COLUMNS) -> int:
+    """
+    Stream rows under the `columns` header (EXCEL_COLUMNS by default) with xlsxwriter.
     
-    # Get current date for Date field
-    current_date = datetime.now().strftime('%d/%m/%Y')
+    constant_memory mode flushes each row to disk as soon as the next one
+    starts, so memory stays flat however many rows are written. Column
+    widths (10-50 chars) track the longest value per column on the way
+    through and are applied when the workbook is closed. Date and time
+    values, e.g. from an existing workbook in append mode, are written
+    with a matching number format so they stay readable.
     
-    # Create rows for Excel - one row per item
-    rows = []
+    The workbook is written next to `output_file` and only replaces it once
+    complete, so a failure part-way through leaves the old file in place.
     
-    for item in items:
-        row = {
-            'Date': current_date,
-            'Source PDF': source_pdf,
-            'Unique Reference Number': general.get('unique_reference_number', ''),
-            'Invoice No.': general.get('invoice_no', ''),
-            'Invoice Date': general.get('invoice_date', ''),
-            'Name of the Supplier': general.get('name_of_the_supplier', ''),
-            'Payment to be made in the name of': general.get('payment_to_be_made_in_the_name_of', ''),
-            'Purchase Type (Import/Indigenous)': general.get('purchase_type', ''),
-            'Type of Stock (Asset/Cons./Service)': item.get('type_of_stock', ''),
-            'Subcategory of the stock': item.get('subcategory_of_stock', ''),
-            'Description of the Item (Item Name)': item.get('item_description', ''),
-            'Net Amount': item.get('net_amount_inr', 0),
-            'Remarks': item.get('remarks', ''),
-            'Total Amount (INR)': amount.get('total_amount_inr', 0),
-            'Advance taken (if any) in INR': amount.get('advance_taken_inr', 0),
-            'Less: Penalty Deducted in INR': amount.get('penalty_deducted_inr', 0),
-            'Net Amount Payable (figure) INR': amount.get('net_amount_payable_figure_inr', 0),
-            'Net Amount Payable (words) INR': amount.get('net_amount_payable_words', ''),
-            'Project No': project.get('project_no', ''),
-            'Project Title': project.get('project_title', ''),
-            'Balance in Project': project.get('balance_in_project', ''),
-            'Overhead Deducted': project.get('overhead_deducted', ''),
-            'Source of payment': project.get('source_of_payment', ''),
-            'Head of expense': project.get('head_of_expense', '')
-        }
-        rows.append(row)
+    Args:
+        rows: Iterable of row sequences in `columns` order
+        output_file: Path to output Excel file
+        columns: Header row
     
-    return rows
+    Returns:
+        Number of data rows written
+    """
+    output_path = Path(output_file)
+    tmp_path = output_path.with_name(output_path.stem + '.partial' + output_path.suffix)
+    col_widths = [len(str(c)) if c is not None else 0 for c in columns]
+    n = 0
+    try:
+        with xlsxwriter.Workbook(str(tmp_path), {
+            'constant_memory': True,
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+        }) as wb:
+            ws = wb.add_worksheet('Sheet1')
+            date_format = wb.add_format({'num_format': 'yyyy-mm-dd'})
+            datetime_format = wb.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+            time_format = wb.add_format({'num_format': 'hh:mm:ss'})
+            ws.write_row(0, 0, columns)
+            for n, row in enumerate(rows, start=1):
+                for i, v in enumerate(row):
+                    if v is None:
+                        continue
+                    if isinstance(v, datetime):
+                        has_time = v.time() != dt_time()
+                        ws.write_datetime(n, i, v, datetime_format if has_time else date_format)
+                    elif isinstance(v, date):
+                        ws.write_datetime(n, i, v, date_format)
+                    elif isinstance(v, dt_time):
+                        ws.write_datetime(n, i, v, time_format)
+                    else:
+                        ws.write(n, i, v)
+                    col_widths[i] = max(col_widths[i], len(str(v)))
+            
+            for i, width in enumerate(col_widths):
+                ws.set_column(i, i, min(50, max(10, width + 2)))
+    except BaseException:
+        # Rows may come from a live extraction; don't replace the file with a partial one
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, output_path)
+    return n
 
 
-def aggregate_to_excel(json_input: Union[str, Path, Dict[str, Any]], output_file: str, source_pdf: str = "", append_mode: bool = False) -> None:
+def iter_excel_rows(excel_file: Union[str, Path]):
+    """
+    Yield the header row of an existing workbook, then its non-empty data rows.
+    
+    The sheet is opened read-only, so rows are parsed lazily rather than
+    loaded as a whole. Every column is returned as it is in the file,
+    including ones that are not in EXCEL_COLUMNS.
+    """
+    wb = openpyxl.load_workbook(excel_file, read_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        yield tuple(next(rows, None) or ())
+        for row in rows:
+            if any(v is not None for v in row):
+                yield row
+    finally:
+        wb.close()
+
+
+def aggregate_to_excel(json_input: Union[str, Path, Dict[str, Any], list, Iterator[tuple]], output_file: str, source_pdf: str = "", append_mode: bool = False) -> None:
     """
     Convert payment voucher JSON data to Excel format.
-    Can handle single JSON dict, single JSON file, or directory of JSON files.
+    Can handle single JSON dict, single JSON file, directory of JSON files,
+    the results list returned by process_all_pdfs, or the live results of
+    iter_process_pdfs.
     
     Args:
         json_input: Can be:
             - Dictionary: Single JSON data
             - String/Path to file: Single JSON file
             - String/Path to directory: Directory containing JSON files
+            - List of (basename, parsed, err) tuples: In-memory extraction
+              results, aggregated without re-reading the JSON files
+            - Iterator of (basename, parsed, err) tuples: Results streamed
+              from iter_process_pdfs, written in completion order while
+              extraction continues
         output_file: Path to output Excel file
         source_pdf: Name of source PDF file (only used for single dict input)
         append_mode: If True, append to existing Excel file; if False, create new file
     """
-    all_rows = []
+    # Rows are produced lazily and written as they come, so only one voucher
+    # is held in memory at a time
     
     # Handle different input types
     if isinstance(json_input, dict):
         # Direct JSON dictionary
-        all_rows.extend(process_single_json(json_input, source_pdf))
+        rows = iter_rows_from_json(json_input, source_pdf)
+        
+    elif isinstance(json_input, list):
+        # Results from process_all_pdfs; ordered by JSON filename like a directory
+        results = sorted((r for r in json_input if isinstance(r[1], dict)), key=lambda r: f'{r[0]}.json')
+        print(f"Processing {len(results)} extracted voucher(s)...")
+        rows = _iter_voucher_rows((f'{basename}.json', parsed) for basename, parsed, _ in results)
+        
+    elif isinstance(json_input, Iterator):
+        # Live results from iter_process_pdfs; each voucher is written as it arrives
+        rows = _iter_voucher_rows(
+            (f'{basename}.json', parsed) for basename, parsed, _ in json_input if isinstance(parsed, dict)
+        )
         
     elif isinstance(json_input, (str, Path)):
         json_path = Path(json_input)
         
         if json_path.is_file():
             # Single JSON file
-            with open(json_path, 'r', encoding='utf-8') as f:
-                json_data = json.load(f)
+            with open(json_path, 'rb') as f:
+                json_data = orjson.loads(f.read())
             source_name = json_path.stem + '.pdf'
-            all_rows.extend(process_single_json(json_data, source_name))
+            rows = iter_rows_from_json(json_data, source_name)
             
         elif json_path.is_dir():
             # Directory of JSON files
@@ -710,87 +1525,155 @@ def aggregate_to_excel(json_input: Union[str, Path, Dict[str, Any]], output_file
                 return
             
             print(f"Processing {len(json_files)} JSON file(s)...")
-            
-            for json_file in json_files:
-                try:
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        json_data = json.load(f)
-                    
-                    # Use JSON filename (without .json) as source PDF name
-                    source_name = json_file.stem + '.pdf'
-                    rows = process_single_json(json_data, source_name)
-                    all_rows.extend(rows)
-                    print(f"  ✓ Processed: {json_file.name} ({len(rows)} rows)")
-                    
-                except Exception as e:
-                    print(f"  ✗ Error processing {json_file.name}: {str(e)}")
-                    continue
+            rows = _iter_voucher_rows((p.name, data) for p, data in iter_json_files(json_files))
         else:
             raise ValueError(f"Path does not exist: {json_path}")
     else:
         raise TypeError(f"Invalid input type: {type(json_input)}")
     
-    if not all_rows:
+    save_rows_to_excel(rows, output_file, append_mode)
+
+
+def _iter_voucher_rows(vouchers: Iterable[tuple]) -> Iterator[tuple]:
+    """
+    Yield the rows of each (json_name, data) voucher, reporting it as it is processed.
+    
+    `data` may be the exception raised while reading the file; failed
+    vouchers are reported and skipped.
+    """
+    for json_name, json_data in vouchers:
+        try:
+            if isinstance(json_data, Exception):
+                raise json_data
+            
+            # Use JSON filename (without .json) as source PDF name
+            rows = list(iter_rows_from_json(json_data, json_name[:-len('.json')] + '.pdf'))
+        except Exception as e:
+            print(f"  ✗ Error processing {json_name}: {str(e)}")
+            continue
+        print(f"  ✓ Processed: {json_name} ({len(rows)} rows)")
+        yield from rows
+
+
+# Columns identifying a voucher item, used to avoid adding the same item twice
+DEDUP_COLUMNS = ['Unique Reference Number', 'Description of the Item (Item Name)']
+
+
+def _dedup_key(row, indexes: List[int]) -> tuple:
+    """Key a row by the DEDUP_COLUMNS at `indexes`, treating empty cells ('' or None) alike."""
+    return tuple('' if i >= len(row) or row[i] is None else str(row[i]) for i in indexes)
+
+
+def save_rows_to_excel(rows: Iterable[tuple], output_file: str, append_mode: bool = False) -> None:
+    """
+    Write aggregated rows to Excel, skipping duplicates in append mode.
+    
+    `rows` is consumed once, as the workbook is written. In append mode the
+    existing rows are streamed into a fresh workbook followed by the new
+    ones, which replaces the original file only once it has been written
+    completely. Columns the existing file has beyond EXCEL_COLUMNS are kept
+    in place; new rows leave them empty.
+    
+    Args:
+        rows: Row tuples (EXCEL_COLUMNS order) from iter_rows_from_json
+        output_file: Path to output Excel file
+        append_mode: If True, append to existing Excel file; if False, create new file
+    """
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
         print("No data to write to Excel")
         return
     
-    # Create DataFrame from new data
-    new_df = pd.DataFrame(all_rows, columns=EXCEL_COLUMNS)
+    ref_col = EXCEL_COLUMNS.index('Unique Reference Number')
+    stats = {'new': 0, 'existing': 0, 'added': 0}
+    refs = set()
+    
+    def _new_rows():
+        for row in itertools.chain((first_row,), rows):
+            stats['new'] += 1
+            refs.add(row[ref_col])
+            yield row
     
     # Check if we should append to existing file
     output_path = Path(output_file)
     
     if append_mode and output_path.exists():
+        tmp_path = output_path.with_name(output_path.stem + '.tmp' + output_path.suffix)
+        
+        def _appended_rows(existing, columns):
+            # Existing rows keep the file's column layout; new rows are placed into it
+            width = len(columns)
+            dedup_indexes = [columns.index(c) for c in DEDUP_COLUMNS]
+            positions = [columns.index(c) for c in EXCEL_COLUMNS]
+            seen = set()
+            for row in existing:
+                seen.add(_dedup_key(row, dedup_indexes))
+                stats['existing'] += 1
+                yield tuple(row) + (None,) * (width - len(row))
+            for row in _new_rows():
+                placed = [None] * width
+                for i, v in zip(positions, row):
+                    placed[i] = v
+                if _dedup_key(placed, dedup_indexes) not in seen:
+                    stats['added'] += 1
+                    yield placed
+        
         try:
-            # Read existing Excel file
-            existing_df = pd.read_excel(output_path, engine='openpyxl')
-            
-            # Check for duplicate entries based on Unique Reference Number and Item Description
-            # to avoid adding the same voucher items twice
-            merge_cols = ['Unique Reference Number', 'Description of the Item (Item Name)']
-            
-            # Identify duplicates
-            merged = new_df.merge(
-                existing_df[merge_cols], 
-                on=merge_cols, 
-                how='left', 
-                indicator=True
-            )
-            
-            # Keep only new records (not duplicates)
-            new_records = new_df[merged['_merge'] == 'left_only']
-            
-            if len(new_records) == 0:
-                print(f"\n⚠ No new records to add (all {len(new_df)} records already exist)")
-                return
-            
-            # Append new records to existing data
-            final_df = pd.concat([existing_df, new_records], ignore_index=True)
-            
-            print(f"\n📊 Append Mode:")
-            print(f"  Existing rows: {len(existing_df)}")
-            print(f"  New rows added: {len(new_records)}")
-            print(f"  Duplicate rows skipped: {len(new_df) - len(new_records)}")
-            print(f"  Total rows: {len(final_df)}")
+            existing = iter_excel_rows(output_path)
+            header = list(next(existing))
+            columns = header + [c for c in EXCEL_COLUMNS if c not in header]
+            extra = [c for c in header if c not in EXCEL_COLUMNS]
+            if extra:
+                print(f"\n  Keeping {len(extra)} extra column(s) from existing file: "
+                      + ', '.join('(unnamed)' if c is None else str(c) for c in extra))
             
+            total = write_excel(_appended_rows(existing, columns), tmp_path, columns)
         except Exception as e:
+            tmp_path.unlink(missing_ok=True)
+            if stats['new']:
+                # The new rows were already consumed, so there is nothing to fall back on
+                raise
             print(f"\n⚠ Error reading existing file: {str(e)}")
             print("  Creating new file instead...")
-            final_df = new_df
-    else:
-        final_df = new_df
-        if append_mode:
-            print("\n📝 File doesn't exist, creating new file...")
+            write_excel(_new_rows(), output_file)
+            return
+        
+        if stats['added'] == 0:
+            tmp_path.unlink(missing_ok=True)
+            print(f"\n⚠ No new records to add (all {stats['new']} records already exist)")
+            return
+        
+        os.replace(tmp_path, output_path)
+        
+        print(f"\n📊 Append Mode:")
+        print(f"  Existing rows: {stats['existing']}")
+        print(f"  New rows added: {stats['added']}")
+        print(f"  Duplicate rows skipped: {stats['new'] - stats['added']}")
+        print(f"  Total rows: {total}")
+        return
     
-    # Write to Excel
-    final_df.to_excel(output_file, index=False, engine='openpyxl')
+    if append_mode:
+        print("\n📝 File doesn't exist, creating new file...")
+    
+    write_excel(_new_rows(), output_file)
     
     if not append_mode:
         print(f"\n✓ Excel file created successfully: {output_file}")
-        print(f"  Total rows: {len(all_rows)}")
-        print(f"  Unique vouchers: {final_df['Unique Reference Number'].nunique()}")
+        print(f"  Total rows: {stats['new']}")
+        print(f"  Unique vouchers: {len(refs)}")
 
 
+def positive_int(value: str) -> int:
+    """argparse type for worker counts, which ThreadPoolExecutor requires to be at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {number}")
+    return number
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -821,6 +1704,40 @@ def main():
         action='store_true',
         help='Append to existing Excel file instead of overwriting'
     )
+    parser.add_argument(
+        '--max-workers',
+        type=positive_int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f'Number of PDFs to extract concurrently (default: {DEFAULT_MAX_WORKERS})'
+    )
+    parser.add_argument(
+        '--download-workers',
+        type=positive_int,
+        default=DEFAULT_DOWNLOAD_WORKERS,
+        help=f'Number of PDFs to download from Drive concurrently (default: {DEFAULT_DOWNLOAD_WORKERS})'
+    )
+    parser.add_argument(
+        '--rpm',
+        type=int,
+        default=DEFAULT_RPM,
+        help=f'Maximum Gemini requests per minute, 0 for no limit (default: {DEFAULT_RPM})'
+    )
+    parser.add_argument(
+        '--tpm',
+        type=int,
+        default=DEFAULT_TPM,
+        help=f'Maximum Gemini tokens per minute, 0 for no limit (default: {DEFAULT_TPM})'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Ignore cached Gemini responses and re-extract every PDF'
+    )
+    parser.add_argument(
+        '--pretty',
+        action='store_true',
+        help='Write indented JSON to json_outputs/ for easier reading'
+    )
 
     args = parser.parse_args()
     
@@ -829,33 +1746,57 @@ def main():
     print('=' * 60)
     
     # Step 1: Download PDFs
+    folder_id = None
     if args.skip_download:
         print('\n[1/4] Skipping download (using existing PDFs)...')
         pdf_files = sorted(REMOTE_PDFS_DIR.glob('*.pdf'))
     else:
         folder_id = extract_folder_id(args.drive_folder)
-    pdf_files = download_pdfs_from_drive(
-        folder_id, 
-        REMOTE_PDFS_DIR
-    )
+        pdf_files = download_pdfs_from_drive(
+            folder_id, 
+            REMOTE_PDFS_DIR,
+            max_workers=args.download_workers
+        )
     
     if not pdf_files:
         print('No PDF files found. Exiting.')
         sys.exit(1)
     
+    output_path = SCRIPT_DIR / args.output
+    
     # Step 2: Process PDFs with Gemini
     if args.skip_extract:
         print('\n[2/4] Skipping extraction (using existing JSONs)...')
+        
+        # Step 3 & 4: Aggregate to Excel
+        aggregate_to_excel(
+            JSON_OUTPUTS_DIR, 
+            output_path,
+            append_mode=args.append  # Add this parameter
+        )
     else:
-        process_all_pdfs(pdf_files, JSON_OUTPUTS_DIR)
-    
-    # Step 3 & 4: Aggregate to Excel
-    output_path = SCRIPT_DIR / args.output
-    aggregate_to_excel(
-        JSON_OUTPUTS_DIR, 
-        output_path,
-        append_mode=args.append  # Add this parameter
-    )
+        # PDFs are only marked processed once the workbook is saved, otherwise an
+        # interrupted run would skip them next time and their rows would be lost
+        processed_marks = []
+        results = iter_process_pdfs(
+            pdf_files,
+            JSON_OUTPUTS_DIR,
+            max_workers=args.max_workers,
+            rpm=args.rpm,
+            tpm=args.tpm,
+            use_cache=not args.no_cache,
+            pretty=args.pretty,
+            processed_marks=processed_marks
+        )
+        
+        # Step 3 & 4: Write each voucher to Excel as soon as its extraction finishes
+        aggregate_to_excel(
+            results,
+            output_path,
+            append_mode=args.append
+        )
+        for mark in processed_marks:
+            mark_file_as_processed(*mark)
     
     print('\n' + '=' * 60)
     print('Pipeline completed successfully!')